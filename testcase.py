@@ -1,10 +1,21 @@
 import xml.etree.ElementTree as ET
-import itertools
+import functools
+import heapq
+import math
+import multiprocessing
 import random
 import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 
 XACML_NS = {"xacml": "urn:oasis:names:tc:xacml:3.0:core:schema:wd-17"}
 
+# fully qualified tags, resolved once instead of per find() call
+RULE_TAG = f"{{{XACML_NS['xacml']}}}Rule"
+MATCH_TAG = f"{{{XACML_NS['xacml']}}}Match"
+VALUE_TAG = f"{{{XACML_NS['xacml']}}}AttributeValue"
+DESIGNATOR_TAG = f"{{{XACML_NS['xacml']}}}AttributeDesignator"
+
 # =====================================================
 # DATA MODEL
 # =====================================================
@@ -15,40 +26,68 @@ class Rule:
         self.conditions = conditions  # [(attr, category, value)]
 
 class TestCase:
-    def __init__(self, tc_id, attributes, covers):
+    def __init__(self, tc_id, attributes, covers, covers_mask):
         self.id = tc_id
         self.attributes = attributes  # attr -> (value, category)
         self.covers = set(covers)
+        self.covers_mask = covers_mask  # bit j set <=> covers rules[j]
 
     def __repr__(self):
         return f"TC{self.id}: {self.attributes} covers={self.covers}"
 
 
+def mask_bits(mask):
+    # indices of the set bits of a small int (rule masks), lowest first;
+    # each step touches the whole int, so use selected_indices() for
+    # test-case-sized individuals
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def selected_indices(individual):
+    # indices of the set bits of an individual, lowest first, in one
+    # linear scan of its binary digits
+    return [i for i, bit in enumerate(bin(individual)[:1:-1]) if bit == "1"]
+
+
 # =====================================================
 # 1. PARSE POLICY
 # =====================================================
 def parse_policy(policy_file):
-    tree = ET.parse(policy_file)
-    root = tree.getroot()
-
     rules = []
+    depth = 0
+
+    # stream the policy: each top-level element is handled and cleared as
+    # soon as it closes, so only one Rule subtree is held at a time
+    for event, elem in ET.iterparse(policy_file, events=("start", "end")):
+        if event == "start":
+            depth += 1
+            continue
+
+        depth -= 1
+        if depth != 1:  # only direct children of the root, as before
+            continue
 
-    for rule in root.findall("xacml:Rule", XACML_NS):
-        rule_id = rule.get("RuleId")
-        effect = rule.get("Effect")
+        if elem.tag == RULE_TAG:
+            rule_id = elem.get("RuleId")
+            effect = elem.get("Effect")
 
-        conditions = []
-        for match in rule.findall(".//xacml:Match", XACML_NS):
-            value = match.find("xacml:AttributeValue", XACML_NS).text
-            designator = match.find("xacml:AttributeDesignator", XACML_NS)
+            conditions = []
+            for match in elem.iter(MATCH_TAG):
+                value = match.find(VALUE_TAG).text
+                designator = match.find(DESIGNATOR_TAG)
 
-            conditions.append((
-                designator.get("AttributeId"),
-                designator.get("Category"),
-                value
-            ))
+                conditions.append((
+                    designator.get("AttributeId"),
+                    designator.get("Category"),
+                    value
+                ))
 
-        rules.append(Rule(rule_id, effect, conditions))
+            rules.append(Rule(rule_id, effect, conditions))
+
+        elem.clear()
 
     return rules
 
@@ -71,36 +110,107 @@ def build_attribute_domains(rules):
     for attr in domains:
         domains[attr]["values"].add("UNKNOWN")
 
+    # intern attributes and values to small ints for the generator
+    for attr_id, attr in enumerate(domains):
+        domains[attr]["id"] = attr_id
+        domains[attr]["value_ids"] = {
+            v: k for k, v in enumerate(domains[attr]["values"])
+        }
+
     return domains
 
 
+def rule_match_table(rules, domains):
+    # match[attr_id][value_id] -> bitmask of rules that accept that value.
+    # A rule accepts every value of an attribute it does not constrain, so a
+    # combination covers rule j iff bit j survives the AND over attributes.
+    full = (1 << len(rules)) - 1
+    match = [[full] * len(d["value_ids"]) for d in domains.values()]
+
+    for j, rule in enumerate(rules):
+        for attr, _, value in rule.conditions:
+            d = domains[attr]
+            required = d["value_ids"][value]
+            row = match[d["id"]]
+            for k in range(len(row)):
+                if k != required:
+                    row[k] &= ~(1 << j)
+
+    return match
+
+
 # =====================================================
 # 3. GENERATE TEST CASES (DFS / CARTESIAN PRODUCT)
 # =====================================================
-def generate_test_cases(rules):
-    domains = build_attribute_domains(rules)
+def generate_test_cases(rules, max_uncovered=None, domains=None):
+    # pass domains to share them with precompute_groups() for the export
+    if domains is None:
+        domains = build_attribute_domains(rules)
 
     attrs = list(domains.keys())
-    value_sets = [list(domains[a]["values"]) for a in attrs]
+    value_sets = [list(domains[a]["value_ids"]) for a in attrs]
+    categories = [domains[a]["category"] for a in attrs]
+    shape = [len(values) for values in value_sets]
+    match = rule_match_table(rules, domains)
+    full = (1 << len(rules)) - 1
+
+    # keep only (tc_id, covers_mask): the digits are tc_id - 1 in mixed
+    # radix, so they and the strings are decoded at the end, only for the
+    # test cases that survive
+    kept = []
+    uncovered = []  # reservoir of NotApplicable TCs when capped
+    n_uncovered = 0
+    cur = [0] * len(attrs)  # mixed-radix counter, one digit per attribute
+
+    # prefix[i] = AND of the match rows for digits < i; only the digits the
+    # counter just changed are refreshed, so most steps cost a single AND
+    prefix = [full] * (len(attrs) + 1)
+    changed = 0
+
+    for tc_id in range(1, math.prod(shape) + 1):
+        # rule coverage check: one table lookup + AND per changed attribute
+        for i in range(changed, len(cur)):
+            prefix[i + 1] = prefix[i] & match[i][cur[i]]
+        covers_mask = prefix[-1]
+
+        if covers_mask or max_uncovered is None:
+            kept.append((tc_id, covers_mask))
+        else:
+            # reservoir sampling: uniform sample of the uncovered TCs
+            n_uncovered += 1
+            if len(uncovered) < max_uncovered:
+                uncovered.append((tc_id, covers_mask))
+            else:
+                r = random.randrange(n_uncovered)
+                if r < max_uncovered:
+                    uncovered[r] = (tc_id, covers_mask)
+
+        # advance the counter, last attribute fastest (itertools.product order)
+        i = len(cur) - 1
+        while i >= 0:
+            cur[i] += 1
+            if cur[i] < shape[i]:
+                break
+            cur[i] = 0
+            i -= 1
+        changed = max(i, 0)
+
+    if uncovered:
+        kept = sorted(kept + uncovered)
 
     test_cases = []
-    tc_id = 1
-
-    for combination in itertools.product(*value_sets):
-        attributes = {}
-        covers = set()
-
-        for attr, value in zip(attrs, combination):
-            attributes[attr] = (value, domains[attr]["category"])
-
-        # rule coverage check
-        for rule in rules:
-            if all(attributes.get(a, ("", ""))[0] == v
-                   for a, _, v in rule.conditions):
-                covers.add(rule.id)
-
-        test_cases.append(TestCase(tc_id, attributes, covers))
-        tc_id += 1
+    digits = [0] * len(attrs)
+    for tc_id, covers_mask in kept:
+        rest = tc_id - 1
+        for i in reversed(range(len(attrs))):
+            rest, digits[i] = divmod(rest, shape[i])
+
+        attributes = {
+            attr: (value_sets[i][digits[i]], categories[i])
+            for i, attr in enumerate(attrs)
+        }
+        covers = {rules[j].id for j in mask_bits(covers_mask)}
+        test_cases.append(TestCase(tc_id, attributes, covers, covers_mask))
 
     return test_cases
 
@@ -108,97 +218,355 @@ def generate_test_cases(rules):
 # =====================================================
 # 4. REQUEST BUILDER
 # =====================================================
-def build_request_xml(attributes):
-    xml = ['<?xml version="1.0" encoding="UTF-8"?>', '<Request>']
+REQUEST_TEMPLATE = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Request>\n'
+    '{body}'
+    '</Request>'
+)
+CATEGORY_TEMPLATE = (
+    '  <Attributes Category="{category}">\n'
+    '{attributes}'
+    '  </Attributes>\n'
+)
+ATTRIBUTE_TEMPLATE = (
+    '\n'
+    '    <Attribute AttributeId="{attr}">\n'
+    '      <AttributeValue>{value}</AttributeValue>\n'
+    '    </Attribute>\n'
+)
+
+
+def precompute_groups(domains):
+    # (attr, category) pairs grouped by category, in first-seen order.
+    # Invariant across a Cartesian suite, so exports compute it once.
     grouped = {}
+    for attr, d in domains.items():
+        grouped.setdefault(d["category"], []).append(attr)
 
-    for attr, (value, category) in attributes.items():
-        grouped.setdefault(category, []).append((attr, value))
+    return tuple((attr, category)
+                 for category, attrs in grouped.items() for attr in attrs)
 
-    for category, items in grouped.items():
-        xml.append(f'  <Attributes Category="{category}">')
-        for attr, value in items:
-            xml.append(f'''
-    <Attribute AttributeId="{attr}">
-      <AttributeValue>{value}</AttributeValue>
-    </Attribute>''')
-        xml.append('  </Attributes>')
 
-    xml.append('</Request>')
-    return "\n".join(xml)
+def build_request_xml(attributes, groups=None):
+    if groups is not None:
+        return _render_request_xml(
+            groups, tuple(attributes[attr][0] for attr, _ in groups))
 
+    # no precomputed groups: the schema follows the attributes' insertion
+    # order, which decides the category order in the output
+    schema = tuple((attr, category)
+                   for attr, (_, category) in attributes.items())
+    return _render_request_xml(
+        schema, tuple(value for value, _ in attributes.values()))
 
-def export_requests(test_cases, folder):
-    os.makedirs(folder, exist_ok=True)
 
-    for tc in test_cases:
-        path = os.path.join(folder, f"request_{tc.id}.xml")
-        with open(path, "w", encoding="utf-8") as f:
-            f.write(build_request_xml(tc.attributes))
-        print(f"[EXPORT] request_{tc.id}.xml covers={tc.covers}")
+# bounded: re-exports of the same attribute sets (e.g. the optimized suite
+# after the full one) hit the cache without pinning a whole large suite
+@functools.lru_cache(maxsize=4096)
+def _render_request_xml(schema, values):
+    return request_template(schema).format(*values)
+
+
+@functools.lru_cache(maxsize=None)
+def request_template(schema):
+    # partial evaluation: every Cartesian TC shares one (attr, category)
+    # schema, so the XML skeleton is rendered once with positional {i}
+    # slots and each request is a single str.format over its values
+    grouped = {}
 
-    print(f"[OK] Exported {len(test_cases)} requests → {folder}")
+    for i, (attr, category) in enumerate(schema):
+        grouped.setdefault(_escape_braces(category), []).append(
+            ATTRIBUTE_TEMPLATE.format(attr=_escape_braces(attr),
+                                      value=f"{{{i}}}"))
+
+    body = "".join(
+        CATEGORY_TEMPLATE.format(category=category, attributes="".join(slots))
+        for category, slots in grouped.items()
+    )
+    return REQUEST_TEMPLATE.format(body=body)
+
+
+def _escape_braces(text):
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+def _write_file(path, data):
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0)
+    fd = os.open(path, flags, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
+def _render_request(tc, groups, newline):
+    xml = build_request_xml(tc.attributes, groups)
+    if newline != "\n":
+        xml = xml.replace("\n", newline)
+    return xml.encode("utf-8")
+
+
+def _write_request(folder, groups, newline, tc):
+    path = os.path.join(folder, f"request_{tc.id}.xml")
+    _write_file(path, _render_request(tc, groups, newline))
+
+
+def export_requests(test_cases, folder, zip_threshold=1000, max_workers=8,
+                    groups=None, newline=os.linesep):
+    # both outputs are written as bytes with the same explicit line ending;
+    # the default matches the platform, like the old text-mode writes
+    # large suites go into one uncompressed archive instead of a
+    # directory of thousands of tiny files
+    if len(test_cases) > zip_threshold:
+        target = folder + ".zip"
+        with zipfile.ZipFile(target, "w", zipfile.ZIP_STORED) as zf:
+            for tc in test_cases:
+                zf.writestr(f"request_{tc.id}.xml",
+                            _render_request(tc, groups, newline))
+    else:
+        target = folder
+        os.makedirs(folder, exist_ok=True)
+        # small writes are syscall-bound: overlap them across threads
+        with ThreadPoolExecutor(max_workers=max_workers) as ex:
+            write = functools.partial(_write_request, folder, groups, newline)
+            list(ex.map(write, test_cases))
+
+    covering = sum(1 for tc in test_cases if tc.covers_mask)
+    print(f"[OK] Exported {len(test_cases)} requests "
+          f"({covering} cover a rule, {len(test_cases) - covering} cover none)"
+          f" → {target}")
 
 
 # =====================================================
 # 5. COVERAGE
 # =====================================================
 def rule_coverage(test_cases, all_rules):
-    covered = set()
+    # the mask filters out test cases that add no new rule, so the ID
+    # union (which keeps duplicate RuleIds counted once) runs at most once
+    # per rule instead of once per test case
+    covered = 0
+    covered_ids = set()
     for tc in test_cases:
-        covered |= tc.covers
-    return len(covered) / len(all_rules)
+        if tc.covers_mask & ~covered:
+            covered |= tc.covers_mask
+            covered_ids |= tc.covers
+    return len(covered_ids) / len(all_rules)
 
 
 # =====================================================
 # 6. GENETIC ALGORITHM (TEST MINIMIZATION)
 # =====================================================
+# An individual is an int bitset: bit i set <=> test_cases[i] is selected.
 def fitness(individual, test_cases, all_rules,
             alpha=0.8, beta=0.2):
-
-    selected = [tc for bit, tc in zip(individual, test_cases) if bit]
-    if not selected:
+    # one-off scoring; the GA builds the columns once and calls
+    # score_individual() directly
+    columns = rule_columns(test_cases, all_rules)
+    return score_individual(individual, columns, len(test_cases),
+                            alpha, beta)
+
+
+def rule_columns(test_cases, all_rules):
+    # one int bitset per rule ID in all_rules: bit i set iff test_cases[i]
+    # covers that ID. Keyed by ID, not by covers_mask position, so rules
+    # sharing a RuleId count once, as in the set-based coverage.
+    index = {rule_id: j for j, rule_id in enumerate(all_rules)}
+    columns = [bytearray((len(test_cases) + 7) // 8) for _ in index]
+
+    for i, tc in enumerate(test_cases):
+        for rule_id in tc.covers:
+            j = index.get(rule_id)
+            if j is not None:
+                columns[j][i >> 3] |= 1 << (i & 7)
+
+    return [int.from_bytes(col, "little") for col in columns]
+
+
+def score_individual(individual, columns, n_tcs,
+                     alpha=0.8, beta=0.2):
+    # alpha * rule coverage - beta * selection size; each rule check is
+    # one C-level AND of the whole individual against that rule's column
+    size = individual.bit_count()
+    if not size:
         return 0
 
-    cov = rule_coverage(selected, all_rules)
-    penalty = len(selected) / len(test_cases)
+    covered = sum(1 for col in columns if individual & col)
 
-    return alpha * cov - beta * penalty
+    return alpha * covered / len(columns) - beta * size / n_tcs
 
 
-def genetic_algorithm(test_cases, all_rules,
-                      pop_size=20, generations=50):
+def evaluate_population(population, columns, n_tcs,
+                        previous=None, pool=None, chunksize=1):
+    # previous maps last generation's individuals to their scores, so
+    # carried-over elites are not re-scored; clones within this generation
+    # are scored once (int bitsets are their own keys)
+    scores = dict(previous or {})
+    todo = list(dict.fromkeys(ind for ind in population if ind not in scores))
 
-    population = [
-        [random.randint(0, 1) for _ in test_cases]
-        for _ in range(pop_size)
-    ]
+    if todo:
+        if pool is None:
+            fresh = [score_individual(ind, columns, n_tcs) for ind in todo]
+        else:
+            fresh = pool.map(_evaluate_individual, todo, chunksize)
+        scores.update(zip(todo, fresh))
+
+    return [scores[ind] for ind in population]
+
+
+# worker-side state, filled once per process by the pool initializer
+_WORKER = {}
+
+
+def _init_worker(columns, n_tcs):
+    _WORKER["columns"] = columns
+    _WORKER["n_tcs"] = n_tcs
+
+
+def _evaluate_individual(individual):
+    return score_individual(individual, _WORKER["columns"], _WORKER["n_tcs"])
+
+
+def crossover(p1, p2, n):
+    # single point: low bits from p1, the rest from p2
+    point = random.randint(1, n - 1)
+    low = (1 << point) - 1
+    return (p1 & low) | (p2 & ~low)
+
+
+def mutate(individual, n, rate=0.05):
+    # flip each of the n bits with probability rate; the gaps between flips
+    # are geometric, so this draws ~rate * n randoms instead of n
+    if rate <= 0:
+        return individual
+    if rate >= 1:
+        return individual ^ ((1 << n) - 1)
+
+    # set flip bits in a byte buffer; the n-bit mask is built once at the end
+    log_q = math.log1p(-rate)
+    flips = bytearray((n + 7) // 8)
+    i = int(math.log(1.0 - random.random()) / log_q)
+    while i < n:
+        flips[i >> 3] |= 1 << (i & 7)
+        i += 1 + int(math.log(1.0 - random.random()) / log_q)
+
+    return individual ^ int.from_bytes(flips, "little")
+
+
+def tournament(scores, k=3):
+    # index of the fittest of k randomly drawn individuals
+    contenders = random.sample(range(len(scores)), min(k, len(scores)))
+    return max(contenders, key=scores.__getitem__)
+
+
+def evolve(population, columns, n, generations,
+           pool=None, chunksize=1, tournament_size=3, mutation_rate=0.05):
+    pop_size = len(population)
+    previous = {}  # only the last generation's scores are kept
 
     for _ in range(generations):
-        population = sorted(
-            population,
-            key=lambda ind: fitness(ind, test_cases, all_rules),
-            reverse=True
-        )
+        scores = evaluate_population(population, columns, n, previous,
+                                     pool, chunksize)
+        previous = dict(zip(population, scores))
 
-        next_gen = population[:2]  # elitism
+        # elitism: best two first, so population[0] is the best seen
+        elite = heapq.nlargest(2, range(pop_size), key=scores.__getitem__)
+        next_gen = [population[i] for i in elite]
 
         while len(next_gen) < pop_size:
-            p1, p2 = random.sample(population[:10], 2)
-            point = random.randint(1, len(p1) - 1)
-            child = p1[:point] + p2[point:]
-
-            child = [
-                1 - b if random.random() < 0.05 else b
-                for b in child
-            ]
-            next_gen.append(child)
+            p1 = population[tournament(scores, tournament_size)]
+            p2 = population[tournament(scores, tournament_size)]
+            child = crossover(p1, p2, n)
+            next_gen.append(mutate(child, n, mutation_rate))
 
         population = next_gen
 
+    return population
+
+
+def genetic_algorithm(test_cases, all_rules,
+                      pop_size=20, generations=50, tournament_size=3,
+                      n_jobs=1, mutation_rate=0.05):
+
+    n = len(test_cases)
+    population = [random.getrandbits(n) for _ in range(pop_size)]
+
+    columns = rule_columns(test_cases, all_rules)
+
+    # columns are shipped to each worker once, not with every individual
+    pool = None
+    chunksize = 1
+    if n_jobs > 1:
+        pool = multiprocessing.Pool(n_jobs, initializer=_init_worker,
+                                    initargs=(columns, len(test_cases)))
+        chunksize = max(1, pop_size // n_jobs // 4)
+
+    try:
+        population = evolve(population, columns, n, generations,
+                            pool, chunksize, tournament_size, mutation_rate)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
     return population[0]
 
 
+def _evolve_island(task):
+    population, generations, tournament_size, mutation_rate, seed = task
+    # forked workers inherit the parent's RNG state; reseed per island
+    random.seed(seed)
+    return evolve(population, _WORKER["columns"], _WORKER["n_tcs"],
+                  generations, None, 1, tournament_size, mutation_rate)
+
+
+def island_genetic_algorithm(test_cases, all_rules, islands=4,
+                             pop_size=20, generations=50,
+                             migration_interval=10, tournament_size=3,
+                             mutation_rate=0.05):
+    # pop_size is split across independent islands, one process each;
+    # every migration_interval generations each island's best replaces
+    # a non-elite individual of the next island (ring topology)
+    if pop_size < 3 * islands:
+        # two elites plus at least one slot a migrant can replace
+        raise ValueError("pop_size must be at least 3 per island")
+
+    n = len(test_cases)
+    columns = rule_columns(test_cases, all_rules)
+    base, extra = divmod(pop_size, islands)
+    sizes = [base + (k < extra) for k in range(islands)]
+
+    populations = [
+        [random.getrandbits(n) for _ in range(size)]
+        for size in sizes
+    ]
+
+    with multiprocessing.Pool(islands, initializer=_init_worker,
+                              initargs=(columns, n)) as pool:
+        done = 0
+        while done < generations:
+            epoch = min(migration_interval, generations - done)
+            tasks = [
+                (population, epoch, tournament_size, mutation_rate,
+                 random.getrandbits(64))
+                for population in populations
+            ]
+            populations = pool.map(_evolve_island, tasks)
+            done += epoch
+
+            if done < generations:
+                bests = [population[0] for population in populations]
+                for k, population in enumerate(populations):
+                    population[-1] = bests[k - 1]
+
+    # population[0] is each island's elite; return the best of them
+    bests = [population[0] for population in populations]
+    scores = evaluate_population(bests, columns, n)
+    return bests[max(range(islands), key=scores.__getitem__)]
+
+
 # =====================================================
 # 7. MAIN
 # =====================================================
@@ -206,21 +574,21 @@ if __name__ == "__main__":
 
     rules = parse_policy("policy.xml")
     all_rules = {r.id for r in rules}
+    domains = build_attribute_domains(rules)
+    groups = precompute_groups(domains)
 
-    test_cases = generate_test_cases(rules)
+    test_cases = generate_test_cases(rules, domains=domains)
     print("Total generated test cases:", len(test_cases))
     print("Coverage before optimization:",
           rule_coverage(test_cases, all_rules))
 
-    export_requests(test_cases, "requests_full")
+    export_requests(test_cases, "requests_full", groups=groups)
 
     best = genetic_algorithm(test_cases, all_rules)
-    optimized = [
-        tc for bit, tc in zip(best, test_cases) if bit
-    ]
+    optimized = [test_cases[i] for i in selected_indices(best)]
 
     print("Optimized test cases:", len(optimized))
     print("Coverage after optimization:",
           rule_coverage(optimized, all_rules))
 
-    export_requests(optimized, "requests_optimized")
+    export_requests(optimized, "requests_optimized", groups=groups)